@@ -21,18 +21,35 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+WEBHOOK_TIMEOUT = 10
+WEBHOOK_MAX_CONNECTIONS = 100
+
+
+@app.on_event("startup")
+async def startup():
+    # One pooled client for all webhook callbacks, so connections and TLS sessions are reused
+    app.state.http = httpx.AsyncClient(
+        timeout=WEBHOOK_TIMEOUT,
+        limits=httpx.Limits(max_connections=WEBHOOK_MAX_CONNECTIONS)
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.http.aclose()
+
 class JobRequest(BaseModel):
     response_id_path: Path
     ground_truth_path: Path
     webhook_url: str
-
-async def send_webhook_callback(webhook_url: str, payload: Dict):
-    async with httpx.AsyncClient(timeout=10) as client:
-        try:
-            resp = await client.post(webhook_url,json=payload)
-            logger.info(f"Webhook delivered: {resp.status_code}")
-        except Exception as e:
-            print("Webhook failed:", e)
+    mode: Literal["realtime", "batch"] = "realtime"
+
+async def send_webhook_callback(client: httpx.AsyncClient, webhook_url: str, payload: Dict):
+    try:
+        resp = await client.post(webhook_url,json=payload)
+        logger.info(f"Webhook delivered: {resp.status_code}")
+    except Exception as e:
+        print("Webhook failed:", e)
 @app.post('/eval')
 async def eval(request: JobRequest, background_tasks: BackgroundTasks):
     """
@@ -48,6 +65,7 @@ async def eval(request: JobRequest, background_tasks: BackgroundTasks):
     logger.info(f"[EVAL] Response IDs Path: {request.response_id_path}")
     logger.info(f"[EVAL] Ground truth file: {gt_path}")
     logger.info(f"[EVAL] Webhook: {request.webhook_url}")
+    logger.info(f"[EVAL] Judge mode: {request.mode}")
 
     async def run_eval_job():
         start = time.time()
@@ -57,18 +75,17 @@ async def eval(request: JobRequest, background_tasks: BackgroundTasks):
         error_msg = None
 
         try:
-            results = eval_om(
+            # Logs and output file are resolved from the same date, even if the job runs past midnight
+            today = date.today()
+            total_items = await eval_om(
                 response_id_path=request.response_id_path,
-                ground_truth_path=gt_path
+                ground_truth_path=gt_path,
+                use_batch=request.mode == "batch",
+                today=today
             )
 
-            today = date.today()
             result_csv_path = f"eval_{today}.csv"
-
-            if results:
-                total_items = len(results)
-            else:
-                total_items = 0
+            total_items = total_items or 0
 
         except Exception as e:
             status = "failed"
@@ -88,7 +105,7 @@ async def eval(request: JobRequest, background_tasks: BackgroundTasks):
         }
 
         # ---- Send webhook ----
-        await send_webhook_callback(request.webhook_url, payload)
+        await send_webhook_callback(app.state.http, request.webhook_url, payload)
 
     # Run in background
     background_tasks.add_task(run_eval_job)
@@ -1,11 +1,16 @@
-import json
+import asyncio
+import hashlib
 import csv
-import pandas as pd
+import shelve
+import threading
+from operator import itemgetter
+import orjson
 from pathlib import Path
 from datetime import date
-from typing import Dict, List, Optional
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import logging
 from dotenv import load_dotenv
 load_dotenv()
@@ -16,26 +21,42 @@ RESPONSE_LOG_DIR = LOGS_DIR / "openai_agent"
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 LLM_JUDGE_MODEL = os.getenv("LLM_JUDGE_MODEL","gpt-4o-mini")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 LLM_JUDGE_ENABLED = True
 
+if LLM_JUDGE_ENABLED and not OPENAI_API_KEY:
+    raise RuntimeError("OPENAI_API_KEY is not set; it is required for LLM-as-Judge scoring")
+client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+LLM_JUDGE_CONCURRENCY = int(os.getenv("LLM_JUDGE_CONCURRENCY", "20"))
+LLM_JUDGE_ITEMS_PER_PROMPT = int(os.getenv("LLM_JUDGE_ITEMS_PER_PROMPT", "10"))
+if LLM_JUDGE_ITEMS_PER_PROMPT < 1:
+    raise RuntimeError(f"LLM_JUDGE_ITEMS_PER_PROMPT must be at least 1, got {LLM_JUDGE_ITEMS_PER_PROMPT}")
+LLM_JUDGE_BATCH_POLL_MIN = 5
+LLM_JUDGE_BATCH_POLL_MAX = 300
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+LLM_JUDGE_CACHE_PATH = os.getenv("LLM_JUDGE_CACHE_PATH", ".judge_cache")
+# Cache reads/writes run on worker threads and may come from concurrent jobs; shelve is not thread-safe
+judge_cache_lock = threading.Lock()
+
 LLM_JUDGE_CRITERIA = [
     "correctness",
     "relevance",
 ]
 
 LLM_JUDGE_INSTRUCTION = """
-You are an expert evaluator. Score the AI-generated answer compared to the reference answer.
+You are an expert evaluator. You will receive a JSON object with a list of "items".
+Each item has an "id", a "question", a "reference_answer" and an AI "generated_answer".
+Score each AI-generated answer compared to its own reference answer, independently of the other items.
 
 For each criterion, give a score from 0 to 5:
 - correctness: factual correctness (0=completely wrong, 5=perfectly correct)
 - relevance: how relevant the answer is to the question (0=irrelevant, 5=highly relevant)
 
-Return ONLY valid JSON in the following format:
+Return ONLY valid JSON in the following format, with one entry per input item:
 {
-  "correctness": <0-5>,
-  "relevance": <0-5>
+  "scores": [
+    {"id": "<item id>", "correctness": <0-5>, "relevance": <0-5>}
+  ]
 }
 """
 
@@ -43,26 +64,29 @@ logging.basicConfig(level=os.environ.get('LOGLEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
     
 
-def get_today_log_files():
+def get_today_log_files(today: Optional[date] = None):
     """Get today's log file paths"""
-    today = date.today()
+    today = today or date.today()
     routing_file = ROUTING_LOG_DIR / f"routing_{today}.jsonl"
     response_file = RESPONSE_LOG_DIR / f"responses_{today}.jsonl"
     return routing_file, response_file
 
 
-def load_jsonl(file_path: Path) -> List[Dict]:
-    """Load JSONL file into list of dictionaries"""
-    data = []
+def iter_jsonl(file_path: Path) -> Iterator[Dict]:
+    """Yield dictionaries from a JSONL file one line at a time"""
     if not file_path.exists():
         logger.info(f"File not found: {file_path}")
-        return data
+        return
     
-    with open(file_path, 'r', encoding='utf-8') as f:
+    with open(file_path, 'rb') as f:
         for line in f:
             if line.strip():
-                data.append(json.loads(line))
-    return data
+                yield orjson.loads(line)
+
+
+def load_jsonl(file_path: Path) -> List[Dict]:
+    """Load JSONL file into list of dictionaries"""
+    return list(iter_jsonl(file_path))
 
 
 def load_ground_truth(csv_file: Path = Path("single_turn.csv")) -> Dict:
@@ -71,20 +95,19 @@ def load_ground_truth(csv_file: Path = Path("single_turn.csv")) -> Dict:
         logger.info(f"Ground truth file not found: {csv_file}")
         return {}
     
-    df = pd.read_csv(csv_file)
-
     ground_truth = {}
     
-    for _, row in df.iterrows():
-        question = str(row.get('Question', '')).strip()
-        answer = str(row.get('Answers', '')).strip()
-        source_name = str(row.get('Source_Name', '')).strip()
-        
-        if question:
-            ground_truth[question] = {
-                "answer": answer,
-                "source_name": source_name
-            }
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            question = (row.get('Question') or '').strip()
+            answer = (row.get('Answers') or '').strip()
+            source_name = (row.get('Source_Name') or '').strip()
+            
+            if question:
+                ground_truth[question] = {
+                    "answer": answer,
+                    "source_name": source_name
+                }
     
     return ground_truth
 
@@ -99,104 +122,323 @@ def empty_judge_scores() -> dict:
     return scores
 
 
-def judge_with_llm(question: str, reference: str, hypothesis: str) -> dict:
-    """Evaluate AI-generated answer using OpenAI official SDK"""
+def judge_cache_key(question: str, reference: str, hypothesis: str) -> str:
+    """Hash the judge model, judge prompt and inputs into a stable cache key"""
+    raw = f"{LLM_JUDGE_MODEL}|{LLM_JUDGE_INSTRUCTION}|{question}|{reference}|{hypothesis}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def read_judge_cache(keys: List[str]) -> Dict[str, dict]:
+    """Return cached judge scores for the given keys"""
+    with judge_cache_lock, shelve.open(LLM_JUDGE_CACHE_PATH) as cache:
+        return {key: cache[key] for key in keys if key in cache}
+
+
+def write_judge_cache(entries: Dict[str, dict]):
+    """Persist judge scores so identical inputs are not judged again"""
+    if not entries:
+        return
+    with judge_cache_lock, shelve.open(LLM_JUDGE_CACHE_PATH) as cache:
+        cache.update(entries)
+
+
+def build_judge_messages(items: List[Tuple[str, str, str, str]]) -> List[Dict]:
+    """Build the chat messages judging (key, question, reference, hypothesis) items in one prompt.
     
-    if not LLM_JUDGE_ENABLED:
-        return empty_judge_scores()
+    Items are numbered by position in the prompt, which keeps ids short and is how
+    parse_judge_scores maps the answers back.
+    """
+    user_payload = {
+        "items": [
+            {
+                "id": str(idx),
+                "question": question,
+                "reference_answer": reference,
+                "generated_answer": hypothesis
+            }
+            for idx, (_, question, reference, hypothesis) in enumerate(items)
+        ]
+    }
+    return [
+        {"role": "system", "content": LLM_JUDGE_INSTRUCTION},
+        {"role": "user", "content": orjson.dumps(user_payload).decode('utf-8')}
+    ]
+
+
+def parse_judge_scores(content: str, items: List[Tuple[str, str, str, str]], prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Dict[str, dict]:
+    """Convert the judge's JSON answer into judge_* columns keyed by item key.
     
-    try:
-        user_payload = {
-            "question": question,
-            "reference_answer": reference,
-            "generated_answer": hypothesis
-        }
-        
-        completion = client.chat.completions.create(
-            model=LLM_JUDGE_MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": LLM_JUDGE_INSTRUCTION},
-                {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)}
-            ]
-        )
-        
-        content = completion.choices[0].message.content
-        raw_scores = json.loads(content)
+    Prompt tokens are split across items in proportion to their text length,
+    completion tokens evenly. Items missing from the answer are left out.
+    """
+    raw_scores = {}
+    for score in orjson.loads(content).get('scores') or []:
+        if isinstance(score, dict):
+            raw_scores[str(score.get('id'))] = score
+    
+    weights = [len(question) + len(reference) + len(hypothesis) for _, question, reference, hypothesis in items]
+    total_weight = sum(weights) or 1
+    
+    judge_results = {}
+    for idx, (item, weight) in enumerate(zip(items, weights)):
+        raw = raw_scores.get(str(idx))
+        if raw is None:
+            continue
         
         judge_result = {}
         for c in LLM_JUDGE_CRITERIA:
-            judge_result[f"judge_{c}"] = raw_scores.get(c)
+            judge_result[f"judge_{c}"] = raw.get(c)
         
-        judge_result['judge_usage_input'] = completion.usage.prompt_tokens
-        judge_result['judge_usage_output'] = completion.usage.completion_tokens
+        judge_result['judge_usage_input'] = round(prompt_tokens * weight / total_weight) if prompt_tokens is not None else None
+        judge_result['judge_usage_output'] = round(completion_tokens / len(items)) if completion_tokens is not None else None
+        judge_results[item[0]] = judge_result
+    
+    return judge_results
+
+
+@retry(
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)),
+    reraise=True
+)
+async def request_judge_completion(messages: List[Dict]):
+    """Call the judge model, retrying rate limits and transient server/connection errors.
+    
+    The SDK's own retries are disabled so tenacity is the only retry policy.
+    """
+    return await client.with_options(max_retries=0).chat.completions.create(
+        model=LLM_JUDGE_MODEL,
+        response_format={"type": "json_object"},
+        messages=messages
+    )
+
+
+async def judge_with_llm(items: List[Tuple[str, str, str, str]]) -> Dict[str, dict]:
+    """Evaluate a group of AI-generated answers in one call using OpenAI official SDK"""
+    
+    if not LLM_JUDGE_ENABLED:
+        return {}
+    
+    try:
+        completion = await request_judge_completion(build_judge_messages(items))
         
-        return judge_result
+        content = completion.choices[0].message.content
+        return parse_judge_scores(content, items, completion.usage.prompt_tokens, completion.usage.completion_tokens)
     
     except Exception as e:
         logger.info(f"LLM-as-Judge error: {e}")
-        return empty_judge_scores()
+        return {}
 
 
-def evaluate_logs(routing_file: Path, response_file: Path, ground_truth: Dict,response_ids: Optional[List]):
-    """Main evaluation function"""
-    if len(response_ids) == 0:
-        logger.info('There is no response id')
-        return
-    routing_logs = load_jsonl(routing_file)
-    response_logs = load_jsonl(response_file)
+def group_judge_items(items: List[Tuple[str, str, str, str]]) -> List[List[Tuple[str, str, str, str]]]:
+    """Split judge items into groups of LLM_JUDGE_ITEMS_PER_PROMPT"""
+    return [items[i:i + LLM_JUDGE_ITEMS_PER_PROMPT] for i in range(0, len(items), LLM_JUDGE_ITEMS_PER_PROMPT)]
+
 
-    routing_lookup = {r['orchestrator_request_id']: r for r in routing_logs}
+async def submit_judge_batch(groups: List[List[Tuple[str, str, str, str]]]) -> str:
+    """Upload judge requests as a Batch API input file and create the batch.
     
-    conversations = {}
-    for resp in response_logs:
-        orch_id = resp.get('orchestrator_request_id')
-        response_id = resp.get('response_id')
-        
-        if response_id not in conversations:
-            conversations[response_id] = []
-        
-        conversations[response_id].append({
-            'response': resp,
-            'routing': routing_lookup.get(orch_id)
-        })
+    Each group of (key, question, reference, hypothesis) items becomes one request,
+    with the group's index as custom_id. Returns the batch id.
+    """
+    lines = []
+    for custom_id, group in enumerate(groups):
+        request = {
+            "custom_id": str(custom_id),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": LLM_JUDGE_MODEL,
+                "response_format": {"type": "json_object"},
+                "messages": build_judge_messages(group)
+            }
+        }
+        lines.append(orjson.dumps(request))
     
-    results = []
+    batch_input = b"\n".join(lines) + b"\n"
+    input_file = await client.files.create(file=("judge_batch.jsonl", batch_input), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logger.info(f"Submitted judge batch {batch.id} with {len(groups)} requests")
+    return batch.id
+
+
+async def wait_for_judge_batch(batch_id: str):
+    """Poll a batch with exponential backoff until it reaches a terminal status"""
+    delay = LLM_JUDGE_BATCH_POLL_MIN
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in BATCH_TERMINAL_STATUSES:
+            return batch
+        logger.info(f"Judge batch {batch_id} is {batch.status}, checking again in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LLM_JUDGE_BATCH_POLL_MAX)
+
+
+async def judge_with_batch(items: List[Tuple[str, str, str, str]]) -> Dict[str, dict]:
+    """Judge (key, question, reference, hypothesis) items through the OpenAI Batch API, keyed by item key.
+    
+    If the batch does not complete, every item maps to an Exception describing why.
+    """
+    if not LLM_JUDGE_ENABLED or not items:
+        return {}
+    
+    groups = group_judge_items(items)
+    batch_id = await submit_judge_batch(groups)
+    batch = await wait_for_judge_batch(batch_id)
+    if batch.status != "completed" or not batch.output_file_id:
+        logger.info(f"Judge batch {batch_id} ended with status: {batch.status}")
+        error = RuntimeError(f"Judge batch {batch_id} ended with status: {batch.status}")
+        return {item[0]: error for item in items}
+    
+    output = await client.files.content(batch.output_file_id)
+    scores = {}
+    for line in output.content.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        custom_id = record.get('custom_id')
+        response = record.get('response') or {}
+        if record.get('error') or response.get('status_code') != 200:
+            logger.info(f"LLM-as-Judge batch error for {custom_id}: {record.get('error') or response.get('body')}")
+            continue
+        try:
+            group = groups[int(custom_id)]
+            body = response['body']
+            usage = body.get('usage') or {}
+            scores.update(parse_judge_scores(
+                body['choices'][0]['message']['content'],
+                group,
+                usage.get('prompt_tokens'),
+                usage.get('completion_tokens')
+            ))
+        except Exception as e:
+            logger.info(f"LLM-as-Judge batch parse error for {custom_id}: {e}")
+    
+    logger.info(f"Judge batch {batch_id} returned {len(scores)}/{len(items)} scores")
+    return scores
+
+
+async def judge_with_semaphore(sem: asyncio.Semaphore, items: List[Tuple[str, str, str, str]]) -> Dict[str, dict]:
+    """Run judge_with_llm while holding a slot of the concurrency semaphore"""
+    async with sem:
+        return await judge_with_llm(items)
+
+
+def has_judge_scores(judge_scores) -> bool:
+    """Whether a judge result holds a valid 0-5 score for every criterion (and is worth caching)"""
+    if not isinstance(judge_scores, dict):
+        return False
+    for c in LLM_JUDGE_CRITERIA:
+        score = judge_scores.get(f"judge_{c}")
+        if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score <= 5:
+            return False
+    return True
+
+
+async def iter_judged_rows(pending: Dict[str, List[dict]], use_batch: bool = False):
+    """Fill judge scores into result rows and yield each row once its scores are known.
+    
+    pending maps a judge cache key to the rows sharing those judge inputs; rows are
+    dropped from it once yielded.
+    Scores already in the judge cache are reused; only the rest are sent to the API.
+    Token usage columns only count calls made by this run.
+    """
+    def fill(key, judge_scores, from_cache=False):
+        rows = pending.pop(key)
+        for idx, row in enumerate(rows):
+            if isinstance(judge_scores, Exception):
+                row['error'] = str(judge_scores)
+            elif judge_scores:
+                row.update(judge_scores)
+                # Token usage is reported once per API call: on the first row sharing the
+                # judgment, and never for scores served from the cache
+                if from_cache or idx > 0:
+                    row['judge_usage_input'] = None
+                    row['judge_usage_output'] = None
+        return rows
+    
+    if not pending:
+        return
+    
+    if not LLM_JUDGE_ENABLED:
+        for rows in pending.values():
+            for row in rows:
+                yield row
+        return
+    
+    # The shelve cache is file I/O too, so it runs on a worker thread like the CSV writes
+    cached = await asyncio.to_thread(read_judge_cache, list(pending))
+    logger.info(f"LLM-as-Judge: {len(cached)} cached, {len(pending) - len(cached)} to judge")
+    for key, judge_scores in cached.items():
+        for row in fill(key, judge_scores, from_cache=True):
+            yield row
+    
+    to_judge = [
+        (key, rows[0]['question'], rows[0]['reference_answer'], rows[0]['generated_answer'])
+        for key, rows in pending.items()
+    ]
+    
+    if use_batch:
+        fresh = await judge_with_batch(to_judge)
+        await asyncio.to_thread(
+            write_judge_cache,
+            {key: judge_scores for key, judge_scores in fresh.items() if has_judge_scores(judge_scores)}
+        )
+        for item in to_judge:
+            for row in fill(item[0], fresh.get(item[0])):
+                yield row
+        return
+    
+    sem = asyncio.Semaphore(LLM_JUDGE_CONCURRENCY)
+    
+    async def judge_group(group):
+        try:
+            return group, await judge_with_semaphore(sem, group)
+        except Exception as e:
+            return group, {item[0]: e for item in group}
+    
+    for next_done in asyncio.as_completed([judge_group(group) for group in group_judge_items(to_judge)]):
+        group, group_scores = await next_done
+        await asyncio.to_thread(
+            write_judge_cache,
+            {key: judge_scores for key, judge_scores in group_scores.items() if has_judge_scores(judge_scores)}
+        )
+        for item in group:
+            for row in fill(item[0], group_scores.get(item[0])):
+                yield row
+
+
+def build_result_rows(conversations: Dict[str, List[Tuple[Dict, Optional[Dict]]]], ground_truth: Dict, response_ids: FrozenSet[str]):
+    """Yield one evaluation row per logged (response, routing) turn in response_ids, with empty judge columns"""
     conv_idx = -1
-    for _, turns in conversations.items():
-        for _, turn_data in enumerate(turns, start=1):
-            resp = turn_data['response']
-            routing = turn_data['routing']
+    for turns in conversations.values():
+        for resp, routing in turns:
+            # Count every logged turn so conversation/turn numbers don't depend on the filter
             if not resp['previous_response_id']:
                 conv_idx += 1
                 turn = 1
             else:
                 turn += 1
             response_id = resp.get('response_id', '')
+            if response_id not in response_ids:
+                continue
+            
+            routing = routing or {}
             user_query = routing.get('question', '')
-            generated_answer = resp.get('assistant_response', '')
+            generated_answer = resp.get('assistant_response') or ''
             
             gt = ground_truth.get(user_query, {})
             reference_answer = gt.get('answer', '')
             expected_source = gt.get('source_name', '')
             
-            selected_sources = routing.get('selected_sources', []) if routing else []
+            selected_sources = routing.get('selected_sources') or []
             routing_correct = expected_source in selected_sources if expected_source else None
             
-            judge_scores = {}
-            error = None
-            
-            if reference_answer and generated_answer:
-                try:
-                    judge_scores = judge_with_llm(user_query, reference_answer, generated_answer)
-                except Exception as e:
-                    error = str(e)
-                    judge_scores = empty_judge_scores()
-            else:
-                judge_scores = empty_judge_scores()
-                if not reference_answer:
-                    error = "No ground truth available"
-            
             result = {
                 'response_id': response_id,
                 'conversation_id': conv_idx,
@@ -204,51 +446,86 @@ def evaluate_logs(routing_file: Path, response_file: Path, ground_truth: Dict,re
                 'question': user_query,
                 'reference_answer': reference_answer,
                 'generated_answer': generated_answer,
-                'error': error or '',
+                'error': '' if reference_answer else "No ground truth available",
                 'routing_correct': routing_correct,
                 'expected_sources': expected_source,
-                'selected_sources': ','.join(selected_sources) if selected_sources else '',
-                'routing_decision': routing.get('decision', '') if routing else '',
-                'routing_reasoning': routing.get('reasoning', '') if routing else '',
-                'routing_model': routing.get('model', '') if routing else '',
-                'judge_correctness': judge_scores.get('judge_correctness'),
-                'judge_relevance': judge_scores.get('judge_relevance'),
-                'judge_usage_input': judge_scores.get('judge_usage_input'),
-                'judge_usage_output': judge_scores.get('judge_usage_output'),
+                'selected_sources': ','.join(selected_sources),
+                'routing_decision': routing.get('decision', ''),
+                'routing_reasoning': routing.get('reasoning', ''),
+                'routing_model': routing.get('model', ''),
+                **empty_judge_scores(),
             }
-            
-            results.append(result)
-    
-    if results:
-        fieldnames = [
-            'response_id', 'conversation_id', 'turn', 'question', 
-            'reference_answer', 'generated_answer', 'error',
-            'routing_correct', 'expected_sources', 'selected_sources',
-            'routing_decision', 'routing_reasoning', 'routing_model',
-            'judge_correctness', 'judge_relevance',
-            'judge_usage_input', 'judge_usage_output'
-        ]
-        today = date.today()
-        output_csv = f"eval_{today}.csv"
-        with open(output_csv, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
-        logger.info(f"Evaluation complete! Results saved to: {output_csv}")
-        logger.info(f"Total evaluations: {len(results)}")
-    else:
+            yield result
+
+
+async def evaluate_logs(routing_file: Path, response_file: Path, ground_truth: Dict,response_ids: Optional[List], use_batch: bool = False, today: Optional[date] = None):
+    """Main evaluation function, returns the number of rows written"""
+    if len(response_ids) == 0:
+        logger.info('There is no response id')
+        return
+    routing_lookup = {r['orchestrator_request_id']: r for r in iter_jsonl(routing_file)}
+    
+    conversations = {}
+    for resp in iter_jsonl(response_file):
+        routing = routing_lookup.get(resp.get('orchestrator_request_id'))
+        conversations.setdefault(resp.get('response_id'), []).append((resp, routing))
+    
+    if not conversations:
         logger.info("No results to write")
+        return 0
     
-    return results
-def load_response_id(response_id_path: Path):
+    fieldnames = [
+        'response_id', 'conversation_id', 'turn', 'question', 
+        'reference_answer', 'generated_answer', 'error',
+        'routing_correct', 'expected_sources', 'selected_sources',
+        'routing_decision', 'routing_reasoning', 'routing_model',
+        'judge_correctness', 'judge_relevance',
+        'judge_usage_input', 'judge_usage_output'
+    ]
+    today = today or date.today()
+    output_csv = f"eval_{today}.csv"
+    total = 0
+    pending = {}
+    with open(output_csv, 'w', newline='', encoding='utf-8-sig') as f:
+        # Plain csv.writer with a fixed column getter; DictWriter re-validates the keys of every row
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        row_values = itemgetter(*fieldnames)
+        
+        # Rows without a reference or a generated answer are never judged: they are written right
+        # away with empty scores, and judged rows follow as their scores arrive
+        for result in build_result_rows(conversations, ground_truth, frozenset(response_ids)):
+            total += 1
+            if result['reference_answer'] and result['generated_answer'].strip():
+                cache_key = judge_cache_key(result['question'], result['reference_answer'], result['generated_answer'])
+                pending.setdefault(cache_key, []).append(result)
+            else:
+                writer.writerow(row_values(result))
+        f.flush()
+        
+        def write_row(row):
+            writer.writerow(row_values(row))
+            f.flush()
+        
+        # Judge requests stay in flight while a worker thread serializes and flushes each row
+        async for result in iter_judged_rows(pending, use_batch=use_batch):
+            await asyncio.to_thread(write_row, result)
+    
+    logger.info(f"Evaluation complete! Results saved to: {output_csv}")
+    logger.info(f"Total evaluations: {total}")
+    return total
+
+
+def load_response_id(response_id_path: Path) -> List[str]:
+    """Load response ids, one per line, skipping blank lines"""
     with open(response_id_path,'r') as file:
-        response_ids = [line.strip() for line in file.readlines()]
-    return response_ids
-def eval_om(response_id_path: Path,ground_truth_path: Path = Path('single_turn.csv')):
+        return [line.strip() for line in file.read().splitlines() if line.strip()]
+async def eval_om(response_id_path: Path,ground_truth_path: Path = Path('single_turn.csv'), use_batch: bool = False, today: Optional[date] = None):
     response_ids = load_response_id(response_id_path)
     if len(response_ids) == 0:
         logger.info('There is no response id')
         return
     ground_truth = load_ground_truth(ground_truth_path)
-    routing_file, response_file = get_today_log_files()
-    evaluate_logs(routing_file, response_file, ground_truth,response_ids)
\ No newline at end of file
+    today = today or date.today()
+    routing_file, response_file = get_today_log_files(today)
+    return await evaluate_logs(routing_file, response_file, ground_truth,response_ids, use_batch=use_batch, today=today)
\ No newline at end of file